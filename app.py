@@ -2,19 +2,34 @@ import streamlit as st
 import openai
 import tempfile
 import os
+import shutil
+import io
+import hashlib
+import bisect
+import asyncio
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import math
+import numpy as np
 
 # Try to import pydub with fallback handling
 try:
     from pydub import AudioSegment
-    from pydub.silence import split_on_silence
+    import ffmpeg
     PYDUB_AVAILABLE = True
 except ImportError as e:
     st.error(f"❌ Audio processing unavailable: {e}")
     st.error("💡 This may be due to Python 3.13 compatibility issues. Please ensure you have the latest pydub version and ffmpeg installed.")
     PYDUB_AVAILABLE = False
 
+# Local transcription with faster-whisper is optional and only offered to admins
+try:
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
 # Load .env file
 load_dotenv()
 
@@ -22,66 +37,421 @@ load_dotenv()
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 BACKEND_OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 
-def remove_silence_from_audio(audio_path, output_path):
-    """Remove silence from audio file and save as MP3"""
+# Local faster-whisper model settings
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "large-v3")
+LOCAL_WHISPER_DEVICE = os.getenv("LOCAL_WHISPER_DEVICE", "cuda")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "float16")
+LOCAL_WHISPER_BATCH_SIZE = 16
+
+# Maximum number of concurrent Whisper requests when transcribing segments
+MAX_CONCURRENT_TRANSCRIPTIONS = 10
+PREFETCH_BATCHES = 4  # Encoded batches queued ahead of the uploads
+WHISPER_REQUEST_TIMEOUT_S = 600
+
+# Segments are packed into uploads that stay under Whisper's 25 MB limit
+WHISPER_MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+MP3_BITRATE_KBPS = 64
+BATCH_SPACER_MS = 1000  # Silence inserted between packed segments
+
+# Language is detected once from the start of the audio and reused for every upload
+LANGUAGE_DETECTION_MS = 30 * 1000
+
+# verbose_json reports the language by name, but the language parameter takes an ISO-639-1 code
+WHISPER_LANGUAGE_CODES = {
+    "afrikaans": "af", "arabic": "ar", "armenian": "hy", "azerbaijani": "az", "belarusian": "be",
+    "bosnian": "bs", "bulgarian": "bg", "catalan": "ca", "chinese": "zh", "croatian": "hr",
+    "czech": "cs", "danish": "da", "dutch": "nl", "english": "en", "estonian": "et",
+    "finnish": "fi", "french": "fr", "galician": "gl", "german": "de", "greek": "el",
+    "hebrew": "he", "hindi": "hi", "hungarian": "hu", "icelandic": "is", "indonesian": "id",
+    "italian": "it", "japanese": "ja", "kannada": "kn", "kazakh": "kk", "korean": "ko",
+    "latvian": "lv", "lithuanian": "lt", "macedonian": "mk", "malay": "ms", "marathi": "mr",
+    "maori": "mi", "nepali": "ne", "norwegian": "no", "persian": "fa", "polish": "pl",
+    "portuguese": "pt", "romanian": "ro", "russian": "ru", "serbian": "sr", "slovak": "sk",
+    "slovenian": "sl", "spanish": "es", "swahili": "sw", "swedish": "sv", "tagalog": "tl",
+    "tamil": "ta", "thai": "th", "turkish": "tr", "ukrainian": "uk", "urdu": "ur",
+    "vietnamese": "vi", "welsh": "cy",
+}
+
+# Whisper works on 16 kHz mono audio, so anything more is wasted upload bandwidth
+WHISPER_SAMPLE_RATE = 16000
+
+# NumPy sample types for the sample widths pydub produces
+SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+# Samples are squared in blocks of this many seek-step frames to bound peak memory
+SILENCE_BLOCK_FRAMES = 1024
+
+def _mono_float_samples(audio, start, end):
+    """Return samples [start, end) of an AudioSegment as a float64 mono array"""
+    samples = np.frombuffer(audio.raw_data, dtype=SAMPLE_DTYPES[audio.sample_width])
+    block = samples[start * audio.channels:end * audio.channels].astype(np.float64)
+    if audio.channels > 1:
+        block = block.reshape(-1, audio.channels).mean(axis=1)
+    return block
+
+def _fast_nonsilent_ranges(audio, min_silence_ms, thresh_db, seek_step_ms=10, keep_silence_ms=0):
+    """Return [start_ms, end_ms] ranges of non-silent audio using vectorized RMS detection"""
+    sample_count = int(audio.frame_count())
+    total_ms = len(audio)
+    window = int(min_silence_ms * audio.frame_rate / 1000)
+    step = max(int(seek_step_ms * audio.frame_rate / 1000), 1)
+    if window <= 0 or sample_count < window:
+        return [[0, total_ms]]
+
+    # Convert the dBFS threshold once to a linear bound on each window's sum of squares,
+    # so the mean-square comparison needs no per-window division. pydub compares an
+    # integer RMS with <=, i.e. a window is silent when its RMS is below floor(threshold) + 1
+    threshold = (math.floor(audio.max_possible_amplitude * 10 ** (thresh_db / 20)) + 1) ** 2 * window
+
+    # Sum the squares of each seek-step frame, and of the first `head` samples of each frame
+    # for windows that are not a whole number of frames long. The trailing partial frame is
+    # zero-padded. Working block by block keeps memory proportional to the frame count.
+    window_frames, head = divmod(window, step)
+    frame_count = -(-sample_count // step)
+    frame_energy = np.empty(frame_count)
+    head_energy = np.empty(frame_count)
+    for first in range(0, frame_count, SILENCE_BLOCK_FRAMES):
+        last = min(first + SILENCE_BLOCK_FRAMES, frame_count)
+        block = _mono_float_samples(audio, first * step, last * step)
+        block = np.pad(block, (0, (last - first) * step - len(block)))
+        squares = (block * block).reshape(-1, step)
+        frame_energy[first:last] = squares.sum(axis=1)
+        head_energy[first:last] = squares[:, :head].sum(axis=1)
+
+    # Rolling energy of every window from a single cumulative sum over frames
+    cumsum = np.concatenate(([0.0], np.cumsum(frame_energy)))
+    window_starts = np.arange((sample_count - window) // step + 1)
+    energy = cumsum[window_starts + window_frames] - cumsum[window_starts]
+    if head:
+        energy += head_energy[window_starts + window_frames]
+    silent = energy < threshold
+    starts_ms = window_starts * step * 1000 // audio.frame_rate
+
+    # Like pydub, always check the window ending exactly at the end of the audio
+    last_start = sample_count - window
+    if last_start % step:
+        tail = _mono_float_samples(audio, last_start, sample_count)
+        silent = np.append(silent, np.dot(tail, tail) < threshold)
+        starts_ms = np.append(starts_ms, max(total_ms - min_silence_ms, 0))
+
+    # Find runs of silent windows from the transitions of the boolean mask
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1) - 1
+
+    # Each silent window covers min_silence_ms from its start
+    nonsilent_ranges = []
+    prev_end = 0
+    for run_start, run_end in zip(run_starts, run_ends):
+        silence_start = int(starts_ms[run_start])
+        silence_end = min(int(starts_ms[run_end]) + min_silence_ms, total_ms)
+        if silence_start > prev_end:
+            nonsilent_ranges.append([prev_end, silence_start])
+        prev_end = silence_end
+    if prev_end < total_ms:
+        nonsilent_ranges.append([prev_end, total_ms])
+
+    # Pad each range with some of the surrounding silence, merging overlaps
+    padded_ranges = []
+    for start, end in nonsilent_ranges:
+        start = max(start - keep_silence_ms, 0)
+        end = min(end + keep_silence_ms, total_ms)
+        if padded_ranges and start <= padded_ranges[-1][1]:
+            padded_ranges[-1][1] = max(padded_ranges[-1][1], end)
+        else:
+            padded_ranges.append([start, end])
+
+    return padded_ranges
+
+def extract_audio_track(video_path):
+    """Copy the audio stream of a video into an audio-only file without re-encoding"""
+    audio_path = os.path.splitext(video_path)[0] + ".m4a"
+    (
+        ffmpeg
+        .input(video_path)
+        .output(audio_path, vn=None, acodec="copy")
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return audio_path
+
+def transcode_for_upload(media_path):
+    """Transcode the audio of a media file to the 16 kHz mono MP3 that is uploaded to Whisper"""
+    mp3_path = os.path.splitext(media_path)[0] + "_upload.mp3"
+    (
+        ffmpeg
+        .input(media_path)
+        .output(mp3_path, vn=None, ac=1, ar=WHISPER_SAMPLE_RATE, acodec="libmp3lame", audio_bitrate=f"{MP3_BITRATE_KBPS}k")
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return mp3_path
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def _decode_pcm(file_hash, _audio_path):
+    """Decode the audio track of a media file to 16 kHz mono PCM, cached per uploaded file"""
+    pcm, _ = (
+        ffmpeg
+        .input(_audio_path)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=WHISPER_SAMPLE_RATE, vn=None)
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return pcm
+
+def _decode_audio(audio_path, file_hash):
+    """Decode the audio track of a media file to a 16 kHz mono AudioSegment through an ffmpeg pipe"""
+    pcm = _decode_pcm(file_hash, audio_path)
+    return AudioSegment(data=pcm, sample_width=2, frame_rate=WHISPER_SAMPLE_RATE, channels=1)
+
+def _export_mp3(audio, name):
+    """Encode an AudioSegment to an in-memory MP3 file ready for upload"""
+    mp3_file = io.BytesIO()
+    audio.export(mp3_file, format="mp3", bitrate=f"{MP3_BITRATE_KBPS}k")
+    mp3_file.seek(0)
+    mp3_file.name = name  # Whisper infers the format from the file name
+    return mp3_file
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def _condensed_pcm(file_hash, _audio):
+    """Strip silence from decoded audio and return its raw data, cached per uploaded file"""
+    # Find non-silent ranges (silence threshold: -40dBFS, min silence length: 500ms)
+    nonsilent_ranges = _fast_nonsilent_ranges(
+        _audio,
+        min_silence_ms=500,   # 500ms of silence
+        thresh_db=-40,        # -40dBFS threshold
+        seek_step_ms=10,      # Check a window every 10ms rather than every sample
+        keep_silence_ms=100   # Keep 100ms of silence at edges
+    )
+    chunks = [_audio[start:end] for start, end in nonsilent_ranges]
+    if not chunks:
+        return _audio.raw_data
+    
+    # Concatenate all non-silent chunks in a single copy
+    return b"".join(chunk.raw_data for chunk in chunks)
+
+def remove_silence_from_audio(audio, file_hash):
+    """Remove silence from decoded audio and return the condensed AudioSegment"""
     if not PYDUB_AVAILABLE:
         st.warning("⚠️ Audio condensing unavailable - pydub not working. Using original file.")
-        return audio_path
+        return audio
         
     try:
-        # Load audio file
-        audio = AudioSegment.from_file(audio_path)
-        
-        # Split on silence (silence threshold: -40dBFS, min silence length: 500ms)
-        chunks = split_on_silence(
-            audio,
-            min_silence_len=500,  # 500ms of silence
-            silence_thresh=-40,   # -40dBFS threshold
-            keep_silence=100      # Keep 100ms of silence at edges
-        )
-        
-        # Concatenate all non-silent chunks
-        condensed_audio = AudioSegment.empty()
-        for chunk in chunks:
-            condensed_audio += chunk
-        
-        # Export as MP3
-        condensed_audio.export(output_path, format="mp3")
-        return output_path
+        return audio._spawn(_condensed_pcm(file_hash, audio))
     except Exception as e:
         st.error(f"Error processing audio: {e}")
-        return audio_path
+        return audio
+
+def _format_timestamp(seconds):
+    """Format a number of seconds as MM:SS"""
+    minutes, seconds = divmod(seconds, 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+def _estimated_mp3_bytes(duration_ms):
+    """Estimate the encoded size of audio exported by _export_mp3"""
+    return duration_ms * MP3_BITRATE_KBPS // 8
 
-def segment_audio(audio_path, segment_duration_minutes):
-    """Split audio into segments of specified duration"""
+def _pack_segments(segments, max_batch_ms):
+    """Group consecutive segments into batches of at most max_batch_ms of audio that each fit in a single Whisper upload"""
+    groups = []
+    for segment in segments:
+        duration_ms = len(segment['audio'])
+        if groups:
+            group = groups[-1]
+            content_ms = group['content_ms'] + duration_ms
+            packed_ms = group['duration_ms'] + BATCH_SPACER_MS + duration_ms
+            if content_ms <= max_batch_ms and _estimated_mp3_bytes(packed_ms) < WHISPER_MAX_UPLOAD_BYTES:
+                group['segments'].append({
+                    'offset_ms': group['duration_ms'] + BATCH_SPACER_MS,
+                    'header': segment['header']
+                })
+                group['parts'].append(segment['audio'])
+                group['content_ms'] = content_ms
+                group['duration_ms'] = packed_ms
+                continue
+
+        groups.append({
+            'parts': [segment['audio']],
+            'content_ms': duration_ms,
+            'duration_ms': duration_ms,
+            'segments': [{
+                'offset_ms': 0,
+                'header': segment['header']
+            }]
+        })
+
+    # Join each batch's raw data in a single copy, with silence between the packed segments
+    batches = []
+    for group in groups:
+        first = group['parts'][0]
+        spacer = b"\0" * (first.frame_width * int(first.frame_rate * BATCH_SPACER_MS / 1000))
+        batches.append({
+            'audio': first._spawn(spacer.join(part.raw_data for part in group['parts'])),
+            'segments': group['segments']
+        })
+    return batches
+
+def segment_audio(audio, segment_duration_minutes):
+    """Split decoded audio into segments of specified duration, packed into upload batches"""
     if not PYDUB_AVAILABLE:
         st.warning("⚠️ Audio segmentation unavailable - pydub not working. Processing full file.")
         return []
         
     try:
-        audio = AudioSegment.from_file(audio_path)
         segment_length_ms = segment_duration_minutes * 60 * 1000  # Convert to milliseconds
         
         segments = []
         total_duration = len(audio)
         
-        for i in range(0, total_duration, segment_length_ms):
-            segment = audio[i:i + segment_length_ms]
+        # View the samples once and reshape full-length segments into rows without copying
+        samples = np.frombuffer(audio.raw_data, dtype=SAMPLE_DTYPES[audio.sample_width])
+        samples_per_segment = segment_duration_minutes * 60 * audio.frame_rate * audio.channels
+        full_segments = len(samples) // samples_per_segment
+        rows = list(samples[:full_segments * samples_per_segment].reshape(full_segments, samples_per_segment))
+        if len(samples) > full_segments * samples_per_segment:
+            rows.append(samples[full_segments * samples_per_segment:])
+        
+        for index, row in enumerate(rows):
+            i = index * segment_length_ms
+            start_time = i // 1000  # Convert to seconds
+            end_time = min((i + segment_length_ms) // 1000, total_duration // 1000)
             
-            # Create temporary file for segment
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-                segment.export(tmp.name, format="mp3")
-                segments.append({
-                    'path': tmp.name,
-                    'start_time': i // 1000,  # Convert to seconds
-                    'end_time': min((i + segment_length_ms) // 1000, total_duration // 1000)
-                })
+            segments.append({
+                'audio': audio._spawn(row.tobytes()),
+                'header': f"[{_format_timestamp(start_time)} - {_format_timestamp(end_time)}]"
+            })
         
-        return segments
+        # Only pack short segments: cap each batch so there are still at least as many
+        # uploads as concurrent transcription workers
+        max_batch_ms = max(segment_length_ms, math.ceil(total_duration / MAX_CONCURRENT_TRANSCRIPTIONS))
+        return _pack_segments(segments, max_batch_ms)
     except Exception as e:
         st.error(f"Error segmenting audio: {e}")
         return []
 
+async def _whisper_request(session, audio_file, **params):
+    """POST an in-memory MP3 to the Whisper transcription endpoint"""
+    form = aiohttp.FormData()
+    form.add_field("file", audio_file, filename=audio_file.name, content_type="audio/mpeg")
+    form.add_field("model", "whisper-1")
+    for key, value in params.items():
+        form.add_field(key, value)
+
+    async with session.post(f"{openai.api_base}/audio/transcriptions", data=form) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Whisper API error {response.status}: {await response.text()}")
+        if params.get("response_format") == "text":
+            return await response.text()
+        return await response.json()
+
+async def detect_language(session, audio):
+    """Detect the spoken language from the start of the audio, returning an ISO-639-1 code or None"""
+    sample = await asyncio.to_thread(_export_mp3, audio[:LANGUAGE_DETECTION_MS], "language_sample.mp3")
+    transcript = await _whisper_request(session, sample, response_format="verbose_json")
+    return WHISPER_LANGUAGE_CODES.get(transcript["language"].lower())
+
+async def transcribe_batch(session, batch, mp3_file, language=None):
+    """Transcribe a batch of packed segments and return each segment's text with a timestamp header"""
+    # Passing a known language skips Whisper's per-request language detection
+    options = {"language": language} if language else {}
+    if len(batch['segments']) == 1:
+        # Plain text responses skip the JSON payload when no timestamps are needed
+        transcript = await _whisper_request(session, mp3_file, response_format="text", **options)
+        texts = [transcript.strip()]
+    else:
+        # Use Whisper's timestamps to split the text back into the packed segments
+        transcript = await _whisper_request(session, mp3_file, response_format="verbose_json", **options)
+        offsets = [segment['offset_ms'] / 1000 for segment in batch['segments']]
+        parts = [[] for _ in offsets]
+        for whisper_segment in transcript["segments"]:
+            midpoint = (whisper_segment["start"] + whisper_segment["end"]) / 2
+            index = max(bisect.bisect_right(offsets, midpoint) - 1, 0)
+            parts[index].append(whisper_segment["text"].strip())
+        texts = [" ".join(part) for part in parts]
+
+    # Add timestamp and transcript
+    return [f"\n{segment['header']}\n{text}\n" for segment, text in zip(batch['segments'], texts)]
+
+async def transcribe_batches(audio, batches, progress_bar, status_text):
+    """Encode and transcribe all batches as a pipeline on one event loop, returning results in batch order"""
+    results = [[] for _ in batches]
+    completed = 0
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=PREFETCH_BATCHES)
+    upload_workers = min(MAX_CONCURRENT_TRANSCRIPTIONS, len(batches))
+
+    async def encode_batches(executor):
+        # pydub encodes in an ffmpeg subprocess, so encodes queued here run in parallel threads
+        for i, batch in enumerate(batches):
+            encoding = loop.run_in_executor(executor, _export_mp3, batch['audio'], f"batch_{i}.mp3")
+            await queue.put((i, encoding))
+        for _ in range(upload_workers):
+            await queue.put(None)
+
+    async def upload_batches(session, language):
+        nonlocal completed
+        while (item := await queue.get()) is not None:
+            i, encoding = item
+            try:
+                results[i] = await transcribe_batch(session, batches[i], await encoding, language)
+            except Exception as e:
+                st.error(f"❌ Error transcribing upload {i+1}: {e}")
+
+            completed += 1
+            status_text.text(f"Transcribed {completed}/{len(batches)} uploads...")
+            progress_bar.progress(completed / len(batches))
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        async with aiohttp.ClientSession(
+            headers={"Authorization": f"Bearer {openai.api_key}"},
+            timeout=aiohttp.ClientTimeout(total=WHISPER_REQUEST_TIMEOUT_S)
+        ) as session:
+            # Start encoding right away so the first batches are ready once the language is known
+            encoder = asyncio.ensure_future(encode_batches(executor))
+
+            # Detect the language once up front instead of in every upload
+            language = None
+            if len(batches) > 1:
+                status_text.text("Detecting language...")
+                try:
+                    language = await detect_language(session, audio)
+                except Exception as e:
+                    st.warning(f"⚠️ Language detection failed, Whisper will detect it per upload: {e}")
+
+            status_text.text(f"Transcribing {len(batches)} uploads...")
+            await asyncio.gather(encoder, *(upload_batches(session, language) for _ in range(upload_workers)))
+
+    return results
+
+@st.cache_resource(show_spinner=False)
+def load_local_pipeline():
+    """Load the faster-whisper model once per server process"""
+    model = WhisperModel(LOCAL_WHISPER_MODEL, device=LOCAL_WHISPER_DEVICE, compute_type=LOCAL_WHISPER_COMPUTE_TYPE)
+    return BatchedInferencePipeline(model=model)
+
+def transcribe_locally(audio, segment_duration_minutes=None):
+    """Transcribe decoded 16 kHz mono audio with the local faster-whisper batched pipeline"""
+    # The pipeline batches all 30 s windows of the audio through the model together
+    samples = np.frombuffer(audio.raw_data, dtype=np.int16).astype(np.float32) / 32768.0
+    whisper_segments, _ = load_local_pipeline().transcribe(samples, batch_size=LOCAL_WHISPER_BATCH_SIZE)
+    if not segment_duration_minutes:
+        return "".join(whisper_segment.text for whisper_segment in whisper_segments).strip()
+
+    # Group Whisper's timestamped segments into the requested segment windows
+    segment_length_s = segment_duration_minutes * 60
+    total_duration = len(audio) // 1000
+    parts = [[] for _ in range(max(math.ceil(len(audio) / (segment_length_s * 1000)), 1))]
+    for whisper_segment in whisper_segments:
+        midpoint = (whisper_segment.start + whisper_segment.end) / 2
+        index = min(int(midpoint // segment_length_s), len(parts) - 1)
+        parts[index].append(whisper_segment.text.strip())
+
+    transcript_parts = []
+    for i, part in enumerate(parts):
+        start_time = i * segment_length_s
+        end_time = min((i + 1) * segment_length_s, total_duration)
+        transcript_parts.append(f"\n[{_format_timestamp(start_time)} - {_format_timestamp(end_time)}]\n{' '.join(part)}\n")
+    return "".join(transcript_parts)
+
 st.title("🎧 Multilingual MP4 Transcription App")
 st.write("Upload an MP4 file and get the transcription using OpenAI Whisper.")
 
@@ -89,10 +459,12 @@ st.write("Upload an MP4 file and get the transcription using OpenAI Whisper.")
 user_key_input = st.text_input("🔑 Enter your OpenAI API Key:", type="password")
 
 # Determine which API key to use
+is_admin = False
 if user_key_input.startswith("#"):
     # Use backend key only if token matches
     if user_key_input[1:] == ADMIN_TOKEN:
         openai.api_key = BACKEND_OPENAI_KEY
+        is_admin = True
         st.success("✅ Admin token accepted. Using backend API key.")
     else:
         st.error("❌ Invalid admin token.")
@@ -126,88 +498,112 @@ if enable_segmentation:
 else:
     segment_duration = None
 
+use_local_model = False
+if is_admin and FASTER_WHISPER_AVAILABLE:
+    use_local_model = st.checkbox("🖥️ Local Transcription",
+                                  help="Transcribe on this server with faster-whisper instead of the OpenAI API",
+                                  disabled=not PYDUB_AVAILABLE)
+
 # Upload section
 uploaded_file = st.file_uploader("📤 Upload MP4 File", type=["mp4"])
 
 if uploaded_file is not None:
     st.video(uploaded_file)
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
-        tmp.write(uploaded_file.read())
-        tmp_path = tmp.name
+    # Every temporary file lives in one directory that is removed on any exit path
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = os.path.join(temp_dir, "upload.mp4")
+        with open(video_path, "wb") as video_file:
+            # Stream to disk in 1 MiB chunks instead of copying the whole file in memory
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, video_file, length=1024 * 1024)
 
-    # Process audio based on settings
-    processed_audio_path = tmp_path
-    
-    if condensed_audio:
-        st.info("🎵 Processing audio to remove silence...")
-        condensed_path = tmp_path.replace('.mp4', '_condensed.mp3')
-        processed_audio_path = remove_silence_from_audio(tmp_path, condensed_path)
-        st.success("✅ Silence removed from audio!")
-
-    # Handle segmentation or regular transcription
-    if enable_segmentation and segment_duration:
-        st.info("✂️ Segmenting audio for processing...")
-        segments = segment_audio(processed_audio_path, segment_duration)
-        
-        if segments:
-            st.success(f"✅ Audio split into {len(segments)} segments!")
-            
-            # Initialize progress tracking
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            full_transcript = ""
+        # Content hash keys the cached decode and silence removal across reruns
+        with uploaded_file.getbuffer() as buffer:
+            file_hash = hashlib.sha256(buffer).hexdigest()
+
+        # Demux the audio track so later steps never read the video stream
+        audio_path = video_path
+        if PYDUB_AVAILABLE:
+            try:
+                audio_path = extract_audio_track(video_path)
+                os.remove(video_path)
+            except Exception as e:
+                st.warning(f"⚠️ Could not extract audio track, using original file: {e}")
+
+        # Decode the audio track once; condensing and segmentation both work on it in memory
+        audio = None
+        if condensed_audio or enable_segmentation or use_local_model:
+            try:
+                audio = _decode_audio(audio_path, file_hash)
+            except Exception as e:
+                st.error(f"Error decoding audio: {e}")
+
+        if condensed_audio and audio is not None:
+            st.info("🎵 Processing audio to remove silence...")
+            audio = remove_silence_from_audio(audio, file_hash)
+            st.success("✅ Silence removed from audio!")
+
+        # Handle local, segmented or regular transcription
+        if use_local_model and audio is not None:
+            st.info("🖥️ Transcribing locally... Please wait ⏳")
             
-            # Process each segment
-            for i, segment in enumerate(segments):
-                status_text.text(f"Transcribing segment {i+1}/{len(segments)}...")
-                progress_bar.progress((i) / len(segments))
+            try:
+                transcript = transcribe_locally(audio, segment_duration)
                 
-                try:
-                    with open(segment['path'], "rb") as audio_file:
-                        transcript = openai.Audio.transcribe("whisper-1", audio_file)
-                    
-                    # Add timestamp and transcript
-                    start_min = segment['start_time'] // 60
-                    start_sec = segment['start_time'] % 60
-                    end_min = segment['end_time'] // 60
-                    end_sec = segment['end_time'] % 60
-                    
-                    segment_header = f"\n[{start_min:02d}:{start_sec:02d} - {end_min:02d}:{end_sec:02d}]\n"
-                    full_transcript += segment_header + transcript["text"] + "\n"
-                    
-                    # Clean up segment file
-                    os.remove(segment['path'])
-                    
-                except Exception as e:
-                    st.error(f"❌ Error transcribing segment {i+1}: {e}")
-                    continue
+                st.success("✅ Transcription Completed!")
+                st.text_area("📜 Transcription Output", transcript, height=400 if segment_duration else 300)
             
-            # Complete progress
-            progress_bar.progress(1.0)
-            status_text.text("✅ All segments transcribed!")
+            except Exception as e:
+                st.error(f"❌ An error occurred: {e}")
+    
+        elif enable_segmentation and segment_duration:
+            st.info("✂️ Segmenting audio for processing...")
+            batches = segment_audio(audio, segment_duration) if audio is not None else []
             
-            st.success("✅ Segmented Transcription Completed!")
-            st.text_area("📜 Full Transcription Output", full_transcript, height=400)
-        else:
-            st.error("❌ Failed to segment audio file")
+            if batches:
+                segment_count = sum(len(batch['segments']) for batch in batches)
+                st.success(f"✅ Audio split into {segment_count} segments ({len(batches)} uploads)!")
+                
+                # Initialize progress tracking
+                progress_bar = st.progress(0)
+                status_text = st.empty()
+                
+                # Transcribe batches concurrently, keeping results in segment order
+                results = asyncio.run(transcribe_batches(audio, batches, progress_bar, status_text))
+                
+                full_transcript = "".join(text for batch_results in results for text in batch_results)
+                
+                # Complete progress
+                progress_bar.progress(1.0)
+                status_text.text("✅ All segments transcribed!")
+                
+                st.success("✅ Segmented Transcription Completed!")
+                st.text_area("📜 Full Transcription Output", full_transcript, height=400)
+            else:
+                st.error("❌ Failed to segment audio file")
     
-    else:
-        # Regular transcription (non-segmented)
-        st.info("Transcribing... Please wait ⏳")
-        
-        try:
-            with open(processed_audio_path, "rb") as audio_file:
-                transcript = openai.Audio.transcribe("whisper-1", audio_file)
-
-            st.success("✅ Transcription Completed!")
-            st.text_area("📜 Transcription Output", transcript["text"], height=300)
+        else:
+            # Regular transcription (non-segmented)
+            st.info("Transcribing... Please wait ⏳")
+            
+            try:
+                if condensed_audio and audio is not None:
+                    transcript = openai.Audio.transcribe("whisper-1", _export_mp3(audio, "condensed.mp3"), response_format="text")
+                else:
+                    # Downmix to 16 kHz mono 64 kbps before upload, like the segmented path
+                    upload_path = audio_path
+                    if PYDUB_AVAILABLE:
+                        try:
+                            upload_path = transcode_for_upload(audio_path)
+                        except Exception as e:
+                            st.warning(f"⚠️ Could not downmix audio, uploading original track: {e}")
+                    
+                    with open(upload_path, "rb") as audio_file:
+                        transcript = openai.Audio.transcribe("whisper-1", audio_file, response_format="text")
 
-        except Exception as e:
-            st.error(f"❌ An error occurred: {e}")
+                st.success("✅ Transcription Completed!")
+                st.text_area("📜 Transcription Output", transcript.strip(), height=300)
 
-    # Clean up temporary files
-    if os.path.exists(tmp_path):
-        os.remove(tmp_path)
-    if condensed_audio and processed_audio_path != tmp_path and os.path.exists(processed_audio_path):
-        os.remove(processed_audio_path)
+            except Exception as e:
+                st.error(f"❌ An error occurred: {e}")